@@ -1,23 +1,522 @@
 import os
 import sys
-import glob
 import re
 import json
+import hashlib
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import timedelta
 from functools import wraps
 from typing import Optional
+from urllib.parse import urlparse
 
-from flask import Flask, render_template, request, redirect, url_for, make_response, g, abort
+from flask import Flask, Response, render_template, request, redirect, url_for, make_response, g, abort
 from dotenv import load_dotenv
 import firebase_admin
 from firebase_admin import credentials, auth as admin_auth
 import bleach
-from bleach.css_sanitizer import CSSSanitizer
-import html as html_mod
 import stripe
 
+from lesson_index import (
+    PREBUILT_SLUG, Lesson, content_signature, iter_lesson_json, load_prebuilt_index,
+    scan_lessons, slug_from_path,
+)
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import fcntl  # POSIX only; the Windows build runs a single process
+except ImportError:
+    fcntl = None
+
 load_dotenv()
 
+# Rendered lesson pages kept in memory, keyed by (slug, file mtime)
+_LESSON_HTML_CACHE_SIZE = 256
+
+# Optional Redis (REDIS_URL): lesson index shared between workers, keyed by
+# content signature, and a channel announcing new Pro registrations
+_REDIS_INDEX_KEY = 'vs:lesson_idx:v2:'  # bump when Lesson.to_dict changes shape
+_REDIS_INDEX_TTL = 86400
+_REDIS_SOCKET_TIMEOUT = 2  # seconds; an unreachable server must not stall boot
+_REDIS_PRO_CHANNEL = 'vs:pro:invalidate'
+
+# Routes that never look at the signed-in user; before_request skips
+# session verification for these and for /static/
+_ANONYMOUS_PATHS = frozenset(('/login', '/sessionLogin', '/sessionLogout', '/healthz', '/config.js', '/stripe/webhook'))
+
+# Guards the deferred firebase_admin.initialize_app
+_FB_LOCK = threading.Lock()
+
+# Verified session claims are reused for this many seconds before Firebase
+# (with its revocation check) is asked again
+_SESSION_CACHE_TTL = 60
+_SESSION_CACHE_MAX = 10000
+
+# Checkout payload for Pro access; only the URLs, email and metadata vary
+_PRO_LINE_ITEMS = ({
+    'price_data': {
+        'currency': 'gbp',
+        'product_data': {
+            'name': 'INFRA+- Pro Access',
+            'description': 'Lifetime access to all Pro content',
+        },
+        'unit_amount': 999,  # £9.99
+    },
+    'quantity': 1,
+},)
+
+# Stripe webhook event ids already handled (LRU), so retries are no-ops
+_WEBHOOK_SEEN_MAX = 10000
+
+# Single-pass HTML escaping (same output as html.escape / the code-block escape)
+_ESC = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'})
+_CODE_ESC = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+_TAG_RE = re.compile(r"<[^>]+>")
+_SLUG_RE = re.compile(r"[^a-z0-9\- ]+")
+_YT_RE = re.compile(r"(?:youtu\.be/|youtube\.com/(?:watch\?v=|embed/|shorts/))([A-Za-z0-9_-]{6,})")
+_ASPECT_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*:\s*(\d+(?:\.\d+)?)\s*$")
+_PB_RE = re.compile(r"^\d{1,3}(\.\d+)?%$")
+
+# Every inline style the renderer emits comes from these fixed templates;
+# the only variable parts are validated numbers, so nothing needs CSS parsing
+_STATIC_IFRAME_WRAP = 'position:relative;padding-bottom:{pb};height:0;min-height:300px;overflow:hidden;'
+_STATIC_HEIGHT_WRAP = 'position:relative;height:{h}px;overflow:hidden;'
+_STATIC_IFRAME_FILL = 'position:absolute;top:0;left:0;width:100%;height:100%;border:0;'
+_DEFAULT_IFRAME_WRAP = _STATIC_IFRAME_WRAP.format(pb='56.25%')
+
+
+def _iframe_wrap_style(pb: str) -> str:
+    if not _PB_RE.match(pb):
+        return _DEFAULT_IFRAME_WRAP
+    return _STATIC_IFRAME_WRAP.format(pb=pb)
+
+# URLs in lesson blocks must be relative or use one of these schemes
+_SAFE_URL_SCHEMES = frozenset(('http', 'https', 'mailto', ''))
+# Browsers ignore leading control characters and spaces before a scheme
+_URL_LEADING_JUNK = ''.join(map(chr, range(0x21)))
+
+
+def _safe_url(u: str) -> str:
+    """Return the URL if it is relative or uses an allowed scheme, else ''."""
+    u = u.lstrip(_URL_LEADING_JUNK)
+    try:
+        scheme = urlparse(u).scheme
+    except ValueError:
+        return ''
+    return u if scheme in _SAFE_URL_SCHEMES else ''
+
+# Allow-list for the optional DEBUG_SANITIZE bleach pass over rendered lessons
+_ALLOWED_TAGS = list(set(bleach.sanitizer.ALLOWED_TAGS).union({
+    'p', 'pre', 'code', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'table', 'thead', 'tbody', 'tr', 'th', 'td', 'blockquote', 'ul', 'ol', 'li',
+    'iframe', 'img', 'div', 'button', 'input', 'label', 'form', 'span'
+}))
+_ALLOWED_ATTRS = {
+    **bleach.sanitizer.ALLOWED_ATTRIBUTES,
+    'a': ['href', 'title', 'rel', 'target', 'class'],
+    'code': ['class'],
+    'p': ['class'],
+    'pre': ['class'],
+    'h1': ['id', 'class'], 'h2': ['id', 'class'], 'h3': ['id', 'class'], 'h4': ['id', 'class'], 'h5': ['id', 'class'], 'h6': ['id', 'class'],
+    'ul': ['class'], 'ol': ['class'], 'li': ['class'],
+    'table': ['class'], 'thead': ['class'], 'tbody': ['class'], 'tr': ['class'], 'th': ['align'], 'td': ['align'],
+    'iframe': ['src', 'width', 'height', 'allow', 'allowfullscreen', 'frameborder', 'loading', 'referrerpolicy', 'title', 'class', 'style'],
+    'img': ['src', 'alt', 'title', 'width', 'height', 'loading', 'class'],
+    'div': ['class', 'data-answer', 'style'],
+    'button': ['class', 'type'],
+    'input': ['class', 'type', 'name', 'value', 'id', 'checked'],
+    'label': ['for', 'class'],
+    'form': ['class'],
+    'span': ['class']
+}
+_ALLOWED_CSS = [
+    'position', 'padding', 'padding-bottom', 'height', 'overflow',
+    'top', 'left', 'width', 'border', 'max-width', 'min-height'
+]
+_PROTOS = ['http', 'https', 'mailto']
+# Built on first use; Cleaner keeps parser state, so calls are serialized by _CLEANER_LOCK
+_CLEANER_LOCK = threading.Lock()
+_CLEANER = None
+
+
+def _get_cleaner():
+    """Return the DEBUG_SANITIZE Cleaner; call with _CLEANER_LOCK held."""
+    global _CLEANER
+    if _CLEANER is None:
+        # Only the debug canary needs tinycss2, so it is imported here
+        from bleach.css_sanitizer import CSSSanitizer
+        _CLEANER = bleach.sanitizer.Cleaner(
+            tags=_ALLOWED_TAGS,
+            attributes=_ALLOWED_ATTRS,
+            protocols=_PROTOS,
+            strip=True,
+            css_sanitizer=CSSSanitizer(allowed_css_properties=_ALLOWED_CSS),
+        )
+    return _CLEANER
+
+
+def _find_sa(static_dir: str) -> Optional[str]:
+    """Pick a bundled service account key: the first *firebase-adminsdk*.json
+    by name, else the first *.json, in a single directory scan."""
+    best = None
+    fallback = None
+    try:
+        it = os.scandir(static_dir)
+    except OSError:
+        return None
+    with it:
+        for e in it:
+            n = e.name
+            # Same matches as glob: no hidden files, case-sensitive suffix
+            if n.startswith('.') or not n.endswith('.json') or not e.is_file():
+                continue
+            if 'firebase-adminsdk' in n:
+                if best is None or n < best[0]:
+                    best = (n, e.path)
+            elif fallback is None or n < fallback[0]:
+                fallback = (n, e.path)
+    found = best or fallback
+    return found[1] if found else None
+
+
+# -------------------- Lesson block rendering --------------------
+class _RenderContext:
+    """Per-lesson state shared by the block renderers."""
+    __slots__ = ('parts', 'write', 'toc', 'used_ids', 'quiz_counter')
+
+    def __init__(self):
+        # Blocks are written as fragments, each terminated by a newline
+        self.parts = []
+        self.write = self.parts.append
+        self.toc = []
+        self.used_ids = set()
+        self.quiz_counter = 0
+
+
+def _hesc(s: object) -> str:
+    return str(s if s is not None else '').translate(_ESC)
+
+
+def _youtube_embed(url: str) -> str:
+    # Basic YouTube URL to embed conversion
+    yt = None
+    m = _YT_RE.search(url)
+    if m:
+        yt = m.group(1)
+    if yt:
+        # Responsive 16:9 container without relying on external CSS
+        wrapper_start = f'<div style="{_DEFAULT_IFRAME_WRAP}">'
+        iframe = (
+            f'<iframe src="https://www.youtube.com/embed/{yt}" '
+            'title="YouTube video" frameborder="0" '
+            'allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture; web-share" '
+            'allowfullscreen loading="lazy" referrerpolicy="strict-origin-when-cross-origin" '
+            f'style="{_STATIC_IFRAME_FILL}"'
+            '></iframe>'
+        )
+        wrapper_end = '</div>'
+        return wrapper_start + iframe + wrapper_end
+    return ''
+
+
+def _render_heading(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    level = int(b.get('level') or 2)
+    level = max(1, min(level, 6))
+    text = str(b.get('text') or '')
+    tag = f"h{level}"
+    # Visible heading text should escape tags so they render literally
+    clean_text = _hesc(text)
+    # slug id derived from raw text without angle-bracket tags
+    slug_src = _TAG_RE.sub('', str(text))
+    base_id = _SLUG_RE.sub('', slug_src.lower()).strip().replace(' ', '-') or tag
+    unique_id = base_id
+    i = 2
+    while unique_id in ctx.used_ids:
+        unique_id = f"{base_id}-{i}"
+        i += 1
+    ctx.used_ids.add(unique_id)
+    write('<'); write(tag); write(' id="'); write(unique_id); write('">')
+    write(clean_text)
+    write('</'); write(tag); write('>\n')
+    ctx.toc.append({
+        'level': level,
+        'id': unique_id,
+        'text': clean_text
+    })
+
+
+def _render_paragraph(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    write('<p>'); write(_hesc(b.get('text') or '')); write('</p>\n')
+
+
+def _render_code(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    lang = str(b.get('language') or '').lower()
+    code = str(b.get('code') or '')
+    if lang:
+        write('<pre><code class="language-'); write(_hesc(lang)); write('">')
+    else:
+        write('<pre><code>')
+    write(code.translate(_CODE_ESC))
+    write('</code></pre>\n')
+
+
+def _render_list(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    items = b.get('items') or []
+    tag = 'ol' if b.get('ordered') else 'ul'
+    write('<'); write(tag); write('>')
+    write(''.join('<li>' + _hesc(it) + '</li>' for it in items))
+    write('</'); write(tag); write('>\n')
+
+
+def _render_table(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    headers = b.get('headers') or []
+    rows = b.get('rows') or []
+    write('<div class="not-prose overflow-x-auto"><table class="min-w-full">')
+    if headers:
+        write('<thead><tr>')
+        write(''.join('<th>' + _hesc(h) + '</th>' for h in headers))
+        write('</tr></thead>')
+    write('<tbody>')
+    for r in rows:
+        write('<tr>')
+        write(''.join('<td>' + _hesc(c) + '</td>' for c in (r or [])))
+        write('</tr>')
+    write('</tbody></table></div>\n')
+
+
+def _render_steps(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    items = b.get('items') or []
+    write('<ol>')
+    write(''.join('<li>' + _hesc(it) + '</li>' for it in items))
+    write('</ol>\n')
+
+
+def _render_image(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    src = _safe_url(str(b.get('src') or '').strip())
+    if src:
+        write('<p><img src="'); write(_hesc(src))
+        write('" alt="'); write(_hesc(b.get('alt') or ''))
+        write('" loading="lazy" /></p>\n')
+
+
+def _render_link(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    url = _safe_url(str(b.get('url') or '').strip())
+    if url:
+        write('<p><a href="'); write(_hesc(url))
+        write('" target="_blank" rel="noopener noreferrer">')
+        write(_hesc(b.get('text') or url))
+        write('</a></p>\n')
+
+
+def _render_embed(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    url = _safe_url(str(b.get('url') or '').strip())
+    if 'youtube.com' in url or 'youtu.be' in url:
+        iframe = _youtube_embed(url)
+        if iframe:
+            write(iframe); write('\n')
+        else:
+            write('<p><a href="'); write(_hesc(url))
+            write('" target="_blank" rel="noopener noreferrer">Open video</a></p>\n')
+    else:
+        # Fallback to link for non-YouTube to avoid unsafe iframes
+        if url:
+            write('<p><a href="'); write(_hesc(url))
+            write('" target="_blank" rel="noopener noreferrer">Open resource</a></p>\n')
+
+
+def _render_iframe(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    src = _safe_url(str(b.get('src') or '').strip())
+    # Optional sizing controls
+    height_val = b.get('height')
+    aspect = str(b.get('aspect') or '16:9')
+    padding_percent = '56.25%'
+    m = _ASPECT_RE.match(aspect)
+    if m:
+        w = float(m.group(1)); h = float(m.group(2))
+        if w > 0 and h > 0:
+            padding_percent = f"{(h / w) * 100:.6f}%"
+    if src:
+        if isinstance(height_val, (int, float)) and height_val > 0:
+            write('<div style="'); write(_STATIC_HEIGHT_WRAP.format(h=int(height_val)))
+            write('">')
+        else:
+            write('<div style="'); write(_iframe_wrap_style(padding_percent))
+            write('">')
+        write('<iframe src="'); write(_hesc(src))
+        write('" title="'); write(_hesc(b.get('title') or 'Embedded content'))
+        write(
+            '" frameborder="0" '
+            'allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture; web-share" '
+            'allowfullscreen loading="lazy" referrerpolicy="strict-origin-when-cross-origin" '
+            f'style="{_STATIC_IFRAME_FILL}"'
+            '></iframe>'
+            '</div>\n'
+        )
+
+
+# Map callout kind to Tailwind colors
+_CALLOUT_COLORS = {
+    'info': 'bg-sky-50 border-sky-200 text-sky-900',
+    'success': 'bg-emerald-50 border-emerald-200 text-emerald-900',
+    'warning': 'bg-amber-50 border-amber-200 text-amber-900',
+    'danger': 'bg-rose-50 border-rose-200 text-rose-900',
+    'note': 'bg-indigo-50 border-indigo-200 text-indigo-900'
+}
+
+
+def _render_callout(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    kind = (b.get('kind') or 'info').lower()
+    write('<div class="not-prose my-4 p-4 border rounded '); write(_CALLOUT_COLORS.get(kind, _CALLOUT_COLORS['info']))
+    write('"><div class="font-semibold mb-1">'); write(_hesc(b.get('title') or kind.title()))
+    write('</div><div class="text-sm opacity-90">'); write(_hesc(b.get('text') or ''))
+    write('</div></div>\n')
+
+
+def _render_example(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    lang = str(b.get('language') or '').lower()
+    code = str(b.get('code') or '')
+    runnable = bool(b.get('runnable')) and lang in ('js', 'javascript', 'html')
+    write(
+        '<div class="not-prose my-4 border rounded overflow-hidden">'
+        '<div class="px-3 py-2 border-b bg-slate-50 flex items-center justify-between">'
+        '<div class="text-xs uppercase tracking-wide text-slate-500">Example</div>'
+    )
+    if runnable:
+        write('<button type="button" class="vs-run-js inline-flex items-center px-3 py-1.5 rounded bg-slate-800 text-white text-sm hover:bg-slate-700">Run</button>')
+    if lang:
+        write('</div><pre class="m-0"><code class="language-'); write(_hesc(lang)); write('">')
+    else:
+        write('</div><pre class="m-0"><code>')
+    write(code.translate(_CODE_ESC))
+    write(
+        '</code></pre>'
+        '<div class="vs-output hidden">'
+        '<iframe class="w-full h-64" sandbox="allow-scripts allow-same-origin"></iframe>'
+        '</div>'
+        '</div>\n'
+    )
+
+
+def _render_quiz(b: dict, ctx: _RenderContext):
+    write = ctx.write
+    choices = b.get('choices') or []
+    correct = b.get('correctIndex')
+    if not isinstance(choices, list) or correct is None:
+        return
+    ctx.quiz_counter += 1
+    qid = f"quiz-{ctx.quiz_counter}"
+    explanation = _hesc(b.get('explanation') or '')
+    write('<div class="not-prose my-4 p-4 border rounded vs-quiz" data-answer="'); write(str(int(correct)))
+    write('"><div class="font-medium mb-2">'); write(_hesc(b.get('question') or '')); write('</div>')
+    # Build choices
+    for idx, ch in enumerate(choices):
+        rid = f"{qid}-opt-{idx}"
+        write('<div class="flex items-start gap-2"><input id="'); write(rid)
+        write('" type="radio" name="'); write(qid)
+        write('" value="'); write(str(idx))
+        write('" class="mt-1"><label for="'); write(rid)
+        write('">'); write(_hesc(ch)); write('</label></div>')
+    write(
+        '<div class="mt-3 flex items-center gap-3">'
+        '<button type="button" class="vs-quiz-check px-3 py-1.5 rounded bg-indigo-600 text-white text-sm">Check</button>'
+        '<span class="vs-quiz-result text-sm"></span>'
+        '</div>'
+    )
+    if explanation:
+        write('<div class="vs-quiz-explain mt-2 text-sm text-slate-600 hidden">'); write(explanation); write('</div>')
+    write('</div>\n')
+
+
+# Block type -> renderer; unknown types are ignored
+_BLOCK_HANDLERS = {
+    'heading': _render_heading,
+    'paragraph': _render_paragraph,
+    'code': _render_code,
+    'list': _render_list,
+    'table': _render_table,
+    'steps': _render_steps,
+    'image': _render_image,
+    'link': _render_link,
+    'embed': _render_embed,
+    'iframe': _render_iframe,
+    'callout': _render_callout,
+    'example': _render_example,
+    'quiz': _render_quiz,
+}
+
+
+def _render_blocks(blocks) -> tuple[str, str]:
+    """Render lesson blocks to (content HTML, TOC HTML)."""
+    ctx = _RenderContext()
+    for b in blocks:
+        if not isinstance(b, dict):
+            continue
+        handler = _BLOCK_HANDLERS.get((b.get('type') or '').lower())
+        if handler:
+            handler(b, ctx)
+    # Build TOC HTML
+    if ctx.toc:
+        toc_items = []
+        for item in ctx.toc:
+            indent = (item['level'] - 2) * 12
+            indent = max(0, indent)
+            toc_items.append(
+                f'<a href="#' + item['id'] + f'" class="block pl-{indent} py-1 hover:text-indigo-600">' + item['text'] + '</a>'
+            )
+        toc_html = '\n'.join(toc_items)
+    else:
+        toc_html = ''
+    parts = ctx.parts
+    # Drop the newline after the last block
+    if parts:
+        parts[-1] = parts[-1][:-1]
+    return ''.join(parts), toc_html
+
+
+def _trigrams(s: str) -> set:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def _build_postings(idx: list) -> dict:
+    """Map each trigram of a lesson's searchable text to the lesson positions containing it."""
+    postings = {}
+    for i, item in enumerate(idx):
+        haystack = '\n'.join([item.text, *item.tags_l])
+        for tg in _trigrams(haystack):
+            postings.setdefault(tg, set()).add(i)
+    return postings
+
 
 def create_app() -> Flask:
     app = Flask(__name__, static_folder="static", template_folder="templates")
@@ -30,30 +529,47 @@ def create_app() -> Flask:
     if cookie_domain:
         app.config["SESSION_COOKIE_DOMAIN"] = cookie_domain
 
-    # Firebase Admin init
+    # Firebase Admin: locate the key now (fail fast), initialize on first use
+    sa_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
     if not firebase_admin._apps:
-        sa_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        project_id = os.getenv("FIREBASE_PROJECT_ID")
         # Fallback: try to locate a bundled service account JSON under static/
         if not sa_path or not os.path.exists(sa_path):
             app_root = os.path.dirname(os.path.abspath(__file__))
-            static_dir = os.path.join(app_root, "static")
-            candidates = []
-            if os.path.isdir(static_dir):
-                candidates = sorted(glob.glob(os.path.join(static_dir, "*firebase-adminsdk*.json")))
-                # also try any .json as a last resort
-                if not candidates:
-                    candidates = sorted(glob.glob(os.path.join(static_dir, "*.json")))
-            if candidates:
-                sa_path = candidates[0]
+            found = _find_sa(os.path.join(app_root, "static"))
+            if found:
+                sa_path = found
             else:
                 raise RuntimeError(
                     "Firebase service account key not found. Set GOOGLE_APPLICATION_CREDENTIALS to a valid JSON path or place a key JSON under static/."
                 )
-        cred = credentials.Certificate(sa_path)
-        firebase_admin.initialize_app(cred, {
-            'projectId': project_id
-        })
+
+    def _ensure_firebase():
+        # Loading the key and initializing the SDK is deferred off the boot path
+        if firebase_admin._apps:
+            return
+        with _FB_LOCK:
+            if firebase_admin._apps:
+                return
+            cred = credentials.Certificate(sa_path)
+            firebase_admin.initialize_app(cred, {
+                'projectId': project_id
+            })
+
+    redis_client = None
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        if redis is None:
+            print("REDIS_URL is set but the redis package is not installed; ignoring")
+        else:
+            redis_client = redis.Redis.from_url(
+                redis_url,
+                socket_connect_timeout=_REDIS_SOCKET_TIMEOUT,
+                socket_timeout=_REDIS_SOCKET_TIMEOUT,
+            )
+
+    # Re-run bleach over rendered lessons (canary for the renderer's escaping)
+    debug_sanitize = os.getenv("DEBUG_SANITIZE", "false").lower() == "true"
 
     # Stripe configuration
     stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
@@ -61,34 +577,115 @@ def create_app() -> Flask:
     webhook_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
     
     # Pro access configuration - using user registration instead of email list
+    # Stored one uid per line: registration appends, startup compacts when
+    # needed. Writes hold _pro_lock (threads) and an flock on a sidecar lock
+    # file (workers); the data file itself is swapped by os.replace, so it
+    # can't carry the lock. Plain reads take no lock and create nothing.
+    _pro_lock = threading.Lock()
+
     def _get_pro_users_file() -> str:
+        return os.path.join(app.root_path, 'data', 'pro_users.txt')
+
+    def _get_legacy_pro_users_file() -> str:
         return os.path.join(app.root_path, 'data', 'pro_users.json')
-    
-    def _load_pro_users() -> set:
-        """Load set of Pro users from file"""
+
+    @contextmanager
+    def _pro_users_locked():
         pro_users_file = _get_pro_users_file()
+        os.makedirs(os.path.dirname(pro_users_file), exist_ok=True)
+        with _pro_lock, open(pro_users_file + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield pro_users_file
+
+    def _rewrite_pro_users(pro_users_file: str, pro_users: set):
+        """Atomically replace the Pro users file with one line per uid; call with the lock held"""
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(pro_users_file), prefix='pro_users.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(''.join(uid + '\n' for uid in sorted(pro_users)))
+            os.replace(tmp, pro_users_file)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _read_pro_users(pro_users_file: str) -> tuple:
+        """Return (set of uids, number of non-empty lines) from the Pro users file"""
+        pro_users = set()
+        lines = 0
         if os.path.exists(pro_users_file):
             try:
-                with open(pro_users_file, 'r') as f:
-                    data = json.load(f)
-                    return set(data.get('pro_users', []))
+                with open(pro_users_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        uid = line.strip()
+                        if uid:
+                            pro_users.add(uid)
+                            lines += 1
+            except OSError:
+                pass
+        return pro_users, lines
+
+    def _load_pro_users() -> set:
+        """Load set of Pro users from file, migrating the old JSON store.
+        Reading takes no lock and writes nothing; only a needed compaction does."""
+        pro_users, lines = _read_pro_users(_get_pro_users_file())
+        legacy_file = _get_legacy_pro_users_file()
+        legacy = None
+        if os.path.exists(legacy_file):
+            try:
+                with open(legacy_file, 'r') as f:
+                    legacy = set(json.load(f).get('pro_users', []))
+                pro_users |= legacy
             except:
                 pass
-        return set()
-    
-    def _save_pro_users(pro_users: set):
-        """Save Pro users to file"""
-        pro_users_file = _get_pro_users_file()
-        os.makedirs(os.path.dirname(pro_users_file), exist_ok=True)
-        with open(pro_users_file, 'w') as f:
-            json.dump({'pro_users': list(pro_users)}, f, indent=2)
+        # Compact duplicate appends and fold in the legacy file
+        if legacy is not None or lines != len(pro_users):
+            try:
+                with _pro_users_locked() as pro_users_file:
+                    # Re-read under the lock so appends made since are kept
+                    pro_users = _read_pro_users(pro_users_file)[0] | (legacy or set())
+                    _rewrite_pro_users(pro_users_file, pro_users)
+                    if legacy is not None:
+                        os.replace(legacy_file, legacy_file + '.migrated')
+            except OSError:
+                pass
+        return pro_users
+
+    def _append_pro_user(uid: str):
+        """Append a single Pro user to file"""
+        with _pro_users_locked() as pro_users_file:
+            with open(pro_users_file, 'a', encoding='utf-8') as f:
+                f.write(uid + '\n')
     
     PRO_USERS = _load_pro_users()  # Load existing Pro users
+
+    if redis_client is not None:
+        # Pick up registrations made by other workers
+        def _on_pro_registered(message):
+            uid = message.get('data')
+            if isinstance(uid, bytes):
+                uid = uid.decode('utf-8')
+            if uid:
+                PRO_USERS.add(uid)
+
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{_REDIS_PRO_CHANNEL: _on_pro_registered})
+            pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+        except redis.RedisError as e:
+            print(f"Redis pub/sub unavailable: {e}")
     
     def register_pro_user(uid: str, email: str):
-        """Register a user as Pro"""
+        """Register a user as Pro; a no-op if already registered"""
+        if uid in PRO_USERS:
+            return
         PRO_USERS.add(uid)
-        _save_pro_users(PRO_USERS)
+        _append_pro_user(uid)
+        if redis_client is not None:
+            try:
+                redis_client.publish(_REDIS_PRO_CHANNEL, uid)
+            except redis.RedisError as e:
+                print(f"Redis publish failed: {e}")
         print(f"Registered Pro user: {email} ({uid})")
     
     def is_registered_pro_user(uid: str) -> bool:
@@ -112,16 +709,36 @@ def create_app() -> Flask:
                 return ext
         # 3) Fallback to bundled content within app root
         return os.path.join(app.root_path, 'content')
+    # session cookie -> (expiry on the monotonic clock, decoded claims)
+    _session_cache = {}
+    _session_lock = threading.Lock()
+
     def verify_session_cookie(req) -> Optional[dict]:
         cookie_name = app.config["SESSION_COOKIE_NAME"]
         session_cookie = req.cookies.get(cookie_name)
         if not session_cookie:
             return None
+        now = time.monotonic()
+        cached = _session_cache.get(session_cookie)
+        if cached and cached[0] > now:
+            return cached[1]
+        # Outside the try: a bad service account key must fail loudly,
+        # not read as an invalid cookie and sign everyone out
+        _ensure_firebase()
         try:
             decoded_claims = admin_auth.verify_session_cookie(session_cookie, check_revoked=True)
-            return decoded_claims
         except Exception:
             return None
+        # Never serve claims past the cookie's own expiry
+        ttl = min(_SESSION_CACHE_TTL, decoded_claims.get('exp', float('inf')) - time.time())
+        with _session_lock:
+            if len(_session_cache) >= _SESSION_CACHE_MAX:
+                for key in [k for k, (exp, _) in _session_cache.items() if exp <= now]:
+                    del _session_cache[key]
+                if len(_session_cache) >= _SESSION_CACHE_MAX:
+                    _session_cache.clear()
+            _session_cache[session_cookie] = (now + ttl, decoded_claims)
+        return decoded_claims
 
     def has_pro_access(user) -> bool:
         """Check if user has Pro access (paid registration or Firebase claims)"""
@@ -140,20 +757,27 @@ def create_app() -> Flask:
         
         return is_registered_pro or is_firebase_pro
 
+    def current_user() -> Optional[dict]:
+        """The signed-in user; the session cookie is verified at most once per request,
+        including when verification fails"""
+        if not g.get('_user_verified'):
+            g.user = verify_session_cookie(request)
+            g._user_verified = True
+        return g.user
+
     def login_required(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            user = verify_session_cookie(request)
+            user = current_user()
             if not user:
                 return redirect(url_for('login', next=request.path))
-            g.user = user
             return fn(*args, **kwargs)
         return wrapper
 
     def pro_required(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            user = verify_session_cookie(request)
+            user = current_user()
             if not user:
                 return redirect(url_for('login', next=request.path))
             
@@ -162,86 +786,82 @@ def create_app() -> Flask:
             if not is_pro:
                 return redirect(url_for('pricing'))
             
-            g.user = user
             return fn(*args, **kwargs)
         return wrapper
 
     # Routes
-    # Simple in-memory lesson index
+    # Simple in-memory lesson index, rebuilt only when the content tree changes
     app.config.setdefault('_LESSON_INDEX', None)
-
-    def _slug_from_path(abs_path: str, base_dir: str) -> str:
-        rel = os.path.relpath(abs_path, base_dir)
-        # Normalize to forward slashes
-        rel = rel.replace('\\', '/')
-        if rel.lower().endswith('.json'):
-            rel = rel[:-5]
-        return rel
+    app.config.setdefault('_LESSON_INDEX_SIG', None)
+    app.config.setdefault('_LESSON_BY_SLUG', {})
+    app.config.setdefault('_LESSON_BLOCKS', {})
+    app.config.setdefault('_PRO_LESSONS', [])
 
     def build_lesson_index():
-        base = _content_dir()
-        idx = []
-        for root, _dirs, files in os.walk(base):
-            for fn in files:
-                if not fn.lower().endswith('.json'):
-                    continue
-                fp = os.path.join(root, fn)
-                try:
-                    with open(fp, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                except Exception:
-                    continue
-                title = str(data.get('title') or '')
-                summary = str(data.get('summary') or '')
-                tags = data.get('tags') or []
-                if not isinstance(tags, list):
-                    tags = []
-                blocks = data.get('blocks') or []
-                texts = [title, summary]
-                for b in blocks:
-                    if not isinstance(b, dict):
-                        continue
-                    t = (b.get('type') or '').lower()
-                    if t in ('heading', 'paragraph'):
-                        texts.append(str(b.get('text') or ''))
-                    elif t == 'list':
-                        for it in (b.get('items') or []):
-                            texts.append(str(it or ''))
-                    elif t == 'code':
-                        texts.append(str(b.get('code') or ''))
-                    elif t == 'table':
-                        for h in (b.get('headers') or []): texts.append(str(h or ''))
-                        for row in (b.get('rows') or []):
-                            for c in (row or []): texts.append(str(c or ''))
-                    elif t == 'steps':
-                        for it in (b.get('items') or []): texts.append(str(it or ''))
-                    elif t == 'callout':
-                        texts.append(str(b.get('title') or ''))
-                        texts.append(str(b.get('text') or ''))
-                    elif t == 'quiz':
-                        texts.append(str(b.get('question') or ''))
-                        for ch in (b.get('choices') or []): texts.append(str(ch or ''))
-                        texts.append(str(b.get('explanation') or ''))
-                    elif t == 'link':
-                        texts.append(str(b.get('text') or ''))
-                    elif t == 'image':
-                        texts.append(str(b.get('alt') or ''))
-                slug = _slug_from_path(fp, base)
-                idx.append({
-                    'slug': slug,
-                    'title': title,
-                    'summary': summary,
-                    'tags': tags,
-                    'text': '\n'.join(texts).lower(),
-                })
-        app.config['_LESSON_INDEX'] = idx
+        idx, blocks = scan_lessons(_content_dir())
+        _install_lesson_index(idx, blocks)
         return idx
 
+    def _install_lesson_index(idx: list, blocks: Optional[dict] = None):
+        app.config['_LESSON_INDEX'] = idx
+        app.config['_LESSON_BY_SLUG'] = {item.slug: item for item in idx}
+        # slug -> (mtime_ns, parsed blocks); kept apart from the listing index
+        # and handed over on first render, after which the HTML cache (or the
+        # file) serves the lesson, so bodies are not held for the process life
+        app.config['_LESSON_BLOCKS'] = blocks or {}
+        app.config['_LESSON_POSTINGS'] = (idx, _build_postings(idx))
+        app.config['_PRO_LESSONS'] = [item for item in idx if 'pro' in item.tag_set]
+
+    def _load_shared_index(sig: str):
+        if redis_client is None:
+            return None
+        try:
+            raw = redis_client.get(_REDIS_INDEX_KEY + sig)
+        except redis.RedisError as e:
+            print(f"Redis get failed: {e}")
+            return None
+        if not raw:
+            return None
+        try:
+            return [Lesson.from_dict(d) for d in _loads(raw)]
+        except (ValueError, TypeError, KeyError) as e:
+            # Payload from an older or foreign writer; rebuild and overwrite it
+            print(f"Ignoring malformed shared lesson index: {e}")
+            return None
+
+    def _store_shared_index(sig: str, idx: list):
+        if redis_client is None:
+            return
+        try:
+            redis_client.set(_REDIS_INDEX_KEY + sig, _dumps([item.to_dict() for item in idx]), ex=_REDIS_INDEX_TTL)
+        except redis.RedisError as e:
+            print(f"Redis set failed: {e}")
+
     def get_lesson_index():
-        return app.config.get('_LESSON_INDEX') or build_lesson_index()
+        base = _content_dir()
+        sig = content_signature(base)
+        idx = app.config.get('_LESSON_INDEX')
+        if idx is None or app.config.get('_LESSON_INDEX_SIG') != sig:
+            # The build step (tools/build_lesson_index.py) or another worker
+            # may already have indexed this version of the content
+            idx = load_prebuilt_index(base, sig)
+            if idx is None:
+                idx = _load_shared_index(sig)
+            if idx is not None:
+                _install_lesson_index(idx)
+            else:
+                idx = build_lesson_index()
+                _store_shared_index(sig, idx)
+            app.config['_LESSON_INDEX_SIG'] = sig
+        return idx
+
     @app.before_request
     def load_current_user():
-        g.user = verify_session_cookie(request)
+        p = request.path
+        if p.startswith('/static/') or p in _ANONYMOUS_PATHS:
+            g.user = None
+            return
+        current_user()
 
     @app.get("/")
     def index():
@@ -263,6 +883,7 @@ def create_app() -> Flask:
             return {"error": "Missing idToken"}, 400
         # 5 days session cookie
         expires_in = timedelta(days=5)
+        _ensure_firebase()
         try:
             session_cookie = admin_auth.create_session_cookie(id_token, expires_in=expires_in)
         except Exception as e:
@@ -279,6 +900,10 @@ def create_app() -> Flask:
         # Clear cookie
         resp = make_response({"status": "ok"})
         cookie_name = app.config["SESSION_COOKIE_NAME"]
+        session_cookie = request.cookies.get(cookie_name)
+        if session_cookie:
+            with _session_lock:
+                _session_cache.pop(session_cookie, None)
         domain = app.config.get("SESSION_COOKIE_DOMAIN")
         resp.delete_cookie(cookie_name, domain=domain)
         return resp
@@ -295,37 +920,13 @@ def create_app() -> Flask:
 
     @app.get("/courses")
     def courses():
-        # JSON-only lessons
-        content_dir = _content_dir()
-        lessons = []
-        for root, _, files in os.walk(content_dir):
-            for f in files:
-                lower = f.lower()
-                if lower.endswith('.json'):
-                    abs_path = os.path.join(root, f)
-                    rel_path = os.path.relpath(abs_path, content_dir)
-                    slug = rel_path.replace(os.sep, '/').rsplit('.', 1)[0].replace('\\', '/')
-                    title = f.rsplit('.', 1)[0]
-                    try:
-                        with open(abs_path, 'r', encoding='utf-8') as fh:
-                            data = json.load(fh)
-                            if isinstance(data, dict) and data.get('title'):
-                                title = str(data['title']).strip() or title
-                            # Optional metadata
-                            summary = str(data.get('summary') or '') if isinstance(data, dict) else ''
-                            tags = data.get('tags') or [] if isinstance(data, dict) else []
-                            if not isinstance(tags, list):
-                                tags = []
-                        # Append lesson entry
-                        lessons.append({
-                            'slug': slug,
-                            'title': title,
-                            'summary': summary,
-                            'tags': tags,
-                        })
-                    except Exception:
-                        # Ignore malformed/ unreadable JSON when scanning
-                        pass
+        # JSON-only lessons, projected from the cached index
+        lessons = [{
+            'slug': item.slug,
+            'title': item.title.strip() or item.slug.rsplit('/', 1)[-1],
+            'summary': item.summary,
+            'tags': item.tags,
+        } for item in get_lesson_index()]
         # Sort by title for stable ordering
         lessons.sort(key=lambda l: (l.get('title') or '').lower())
         return render_template("courses.html", lessons=lessons)
@@ -333,326 +934,96 @@ def create_app() -> Flask:
     @app.get('/search')
     def search():
         q = (request.args.get('q') or '').strip()
-        idx = get_lesson_index()
+        get_lesson_index()
+        idx, postings = app.config['_LESSON_POSTINGS']
         results = []
         if q:
             ql = q.lower()
-            for item in idx:
-                score = 0
-                if ql in (item['title'] or '').lower():
-                    score += 3
-                if ql in (item['summary'] or '').lower():
-                    score += 2
-                if any(ql in (str(t).lower()) for t in (item['tags'] or [])):
-                    score += 2
-                if ql in item['text']:
-                    score += 1
+            candidates = idx
+            if len(ql) >= 3:
+                # Every field scored below is part of the trigram haystack, so a
+                # lesson can only match if it contains all of the query's trigrams
+                hits = [postings.get(tg) for tg in _trigrams(ql)]
+                if all(hits):
+                    ids = set.intersection(*sorted(hits, key=len))
+                    candidates = [idx[i] for i in sorted(ids)]
+                else:
+                    candidates = []
+            scored = []
+            for item in candidates:
+                score = ((3 if ql in item.title_l else 0)
+                         + (2 if ql in item.summary_l else 0)
+                         + (2 if any(ql in t for t in item.tags_l) else 0)
+                         + (1 if ql in item.text else 0))
                 if score:
-                    results.append({**item, 'score': score})
-            results.sort(key=lambda r: r['score'], reverse=True)
+                    scored.append((score, item))
+            scored.sort(key=lambda r: r[0], reverse=True)
+            results = [item for _score, item in scored]
         return render_template('search.html', q=q, results=results)
 
+    # Rendered lesson HTML, LRU-ordered; see _LESSON_HTML_CACHE_SIZE
+    _lesson_html_cache = OrderedDict()
+    _lesson_html_lock = threading.Lock()
+
     @app.get("/lesson/<path:slug>")
     def lesson(slug: str):
+        if slug == PREBUILT_SLUG:
+            abort(404)
         content_dir = _content_dir()
         json_path = os.path.join(content_dir, f"{slug}.json")
-        if not os.path.isfile(json_path):
+        try:
+            st = os.stat(json_path)
+        except OSError:
             abort(404)
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        title = str(data.get('title') or 'Lesson')
-        summary = str(data.get('summary') or '')
-        tags = data.get('tags') or []
-        if not isinstance(tags, list):
-            tags = []
+        if not stat.S_ISREG(st.st_mode):
+            abort(404)
+        cache_key = (slug, st.st_mtime_ns)
+        with _lesson_html_lock:
+            cached = _lesson_html_cache.get(cache_key)
+            if cached is not None:
+                _lesson_html_cache.move_to_end(cache_key)
+        if cached is not None:
+            title, summary, tags, html, toc_html = cached
+        else:
+            # Reuse the index's metadata and parsed blocks when they describe
+            # this version of the file; otherwise read the file itself
+            meta = app.config['_LESSON_BY_SLUG'].get(slug)
+            stored = app.config['_LESSON_BLOCKS'].get(slug)
+            if meta is not None and stored is not None and meta.mtime_ns == stored[0] == st.st_mtime_ns:
+                blocks = stored[1]
+            else:
+                with open(json_path, 'rb') as f:
+                    data = _loads(f.read())
+                meta = Lesson.from_data(data, slug, json_path, st.st_mtime_ns)
+                blocks = data.get('blocks') or []
+            title = meta.title or 'Lesson'
+            summary = meta.summary
+            tags = meta.tags
         
-        # Check if this is a Pro lesson
+        # Check if this is a Pro lesson (on every request, cached or not)
         if 'pro' in tags:
             # User must be logged in and have Pro access
-            user = verify_session_cookie(request)
+            user = current_user()
             if not user or not has_pro_access(user):
                 return redirect(url_for('pricing'))
-        
-        blocks = data.get('blocks') or []
-
-        def _youtube_embed(url: str) -> str:
-            # Basic YouTube URL to embed conversion
-            yt = None
-            m = re.search(r"(?:youtu\.be/|youtube\.com/(?:watch\?v=|embed/|shorts/))([A-Za-z0-9_-]{6,})", url)
-            if m:
-                yt = m.group(1)
-            if yt:
-                # Responsive 16:9 container without relying on external CSS
-                wrapper_start = '<div style="position:relative;padding-bottom:56.25%;height:0;min-height:300px;overflow:hidden;">'
-                iframe = (
-                    f'<iframe src="https://www.youtube.com/embed/{yt}" '
-                    'title="YouTube video" frameborder="0" '
-                    'allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture; web-share" '
-                    'allowfullscreen loading="lazy" referrerpolicy="strict-origin-when-cross-origin" '
-                    'style="position:absolute;top:0;left:0;width:100%;height:100%;border:0;"'
-                    '></iframe>'
-                )
-                wrapper_end = '</div>'
-                return wrapper_start + iframe + wrapper_end
-            return ''
-
-        def render_blocks(blocks) -> tuple[str, str]:
-            parts = []
-            toc = []
-            used_ids = set()
-            quiz_counter = 0
-            def hesc(s: object) -> str:
-                return html_mod.escape(str(s if s is not None else ''))
-            for b in blocks:
-                if not isinstance(b, dict):
-                    continue
-                t = (b.get('type') or '').lower()
-                if t == 'heading':
-                    level = int(b.get('level') or 2)
-                    level = max(1, min(level, 6))
-                    text = str(b.get('text') or '')
-                    tag = f"h{level}"
-                    # Visible heading text should escape tags so they render literally
-                    clean_text = hesc(text)
-                    # slug id derived from raw text without angle-bracket tags
-                    slug_src = re.sub(r"<[^>]+>", '', str(text))
-                    base_id = re.sub(r"[^a-z0-9\- ]+", '', slug_src.lower()).strip().replace(' ', '-') or f"h{level}"
-                    unique_id = base_id
-                    i = 2
-                    while unique_id in used_ids:
-                        unique_id = f"{base_id}-{i}"
-                        i += 1
-                    used_ids.add(unique_id)
-                    parts.append(f"<{tag} id=\"{unique_id}\">{clean_text}</{tag}>")
-                    toc.append({
-                        'level': level,
-                        'id': unique_id,
-                        'text': clean_text
-                    })
-                elif t == 'paragraph':
-                    text = str(b.get('text') or '')
-                    parts.append("<p>" + hesc(text) + "</p>")
-                elif t == 'code':
-                    lang = str(b.get('language') or '').lower()
-                    code = str(b.get('code') or '')
-                    cls = f" class=\"language-{lang}\"" if lang else ''
-                    code_esc = (code
-                        .replace('&', '&amp;')
-                        .replace('<', '&lt;')
-                        .replace('>', '&gt;'))
-                    parts.append(f"<pre><code{cls}>" + code_esc + "</code></pre>")
-                elif t == 'list':
-                    items = b.get('items') or []
-                    ordered = bool(b.get('ordered'))
-                    tag = 'ol' if ordered else 'ul'
-                    lis = ''.join(["<li>" + hesc(it) + "</li>" for it in items])
-                    parts.append(f"<{tag}>" + lis + f"</{tag}>")
-                elif t == 'table':
-                    headers = b.get('headers') or []
-                    rows = b.get('rows') or []
-                    thead = ''
-                    if headers:
-                        ths = ''.join([f"<th>" + hesc(h) + "</th>" for h in headers])
-                        thead = f"<thead><tr>{ths}</tr></thead>"
-                    tbody_rows = []
-                    for r in rows:
-                        tds = ''.join([f"<td>" + hesc(c) + "</td>" for c in (r or [])])
-                        tbody_rows.append(f"<tr>{tds}</tr>")
-                    tbody = f"<tbody>{''.join(tbody_rows)}</tbody>"
-                    parts.append(f"<div class=\"not-prose overflow-x-auto\"><table class=\"min-w-full\">{thead}{tbody}</table></div>")
-                elif t == 'steps':
-                    items = b.get('items') or []
-                    lis = ''.join(["<li>" + hesc(it) + "</li>" for it in items])
-                    parts.append("<ol>" + lis + "</ol>")
-                elif t == 'image':
-                    src = str(b.get('src') or '').strip()
-                    alt = hesc(b.get('alt') or '')
-                    if src:
-                        parts.append(f'<p><img src="{src}" alt="{alt}" loading="lazy" /></p>')
-                elif t == 'link':
-                    url = str(b.get('url') or '').strip()
-                    text = str(b.get('text') or url)
-                    if url:
-                        safe_text = hesc(text)
-                        parts.append(f'<p><a href="{url}" target="_blank" rel="noopener noreferrer">{safe_text}</a></p>')
-                elif t == 'embed':
-                    url = str(b.get('url') or '').strip()
-                    if 'youtube.com' in url or 'youtu.be' in url:
-                        iframe = _youtube_embed(url)
-                        if iframe:
-                            parts.append(iframe)
-                        else:
-                            parts.append(f'<p><a href="{url}" target="_blank" rel="noopener noreferrer">Open video</a></p>')
-                    else:
-                        # Fallback to link for non-YouTube to avoid unsafe iframes
-                        if url:
-                            parts.append(f'<p><a href="{url}" target="_blank" rel="noopener noreferrer">Open resource</a></p>')
-                elif t == 'iframe':
-                    src = str(b.get('src') or '').strip()
-                    title_if = hesc(b.get('title') or 'Embedded content')
-                    # Optional sizing controls
-                    height_val = b.get('height')
-                    aspect = str(b.get('aspect') or '16:9')
-                    padding_percent = '56.25%'
-                    if isinstance(aspect, str) and ':' in aspect:
-                        try:
-                            w, h = aspect.split(':', 1)
-                            w = float(w); h = float(h)
-                            if w > 0 and h > 0:
-                                padding_percent = f"{(h / w) * 100:.6f}%"
-                        except Exception:
-                            padding_percent = '56.25%'
-                    if src:
-                        if isinstance(height_val, (int, float)) and height_val > 0:
-                            wrapper_style = f'position:relative;height:{int(height_val)}px;overflow:hidden;'
-                        else:
-                            wrapper_style = f'position:relative;padding-bottom:{padding_percent};height:0;min-height:300px;overflow:hidden;'
-                        parts.append(
-                            f'<div style="{wrapper_style}">'
-                            f'<iframe src="{src}" '
-                            f'title="{title_if}" frameborder="0" '
-                            'allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture; web-share" '
-                            'allowfullscreen loading="lazy" referrerpolicy="strict-origin-when-cross-origin" '
-                            'style="position:absolute;top:0;left:0;width:100%;height:100%;border:0;"'
-                            '></iframe>'
-                            '</div>'
-                        )
-                elif t == 'callout':
-                    kind = (b.get('kind') or 'info').lower()
-                    title_co = hesc(b.get('title') or kind.title())
-                    text_co = hesc(b.get('text') or '')
-                    # Map kind to Tailwind colors
-                    colors = {
-                        'info': 'bg-sky-50 border-sky-200 text-sky-900',
-                        'success': 'bg-emerald-50 border-emerald-200 text-emerald-900',
-                        'warning': 'bg-amber-50 border-amber-200 text-amber-900',
-                        'danger': 'bg-rose-50 border-rose-200 text-rose-900',
-                        'note': 'bg-indigo-50 border-indigo-200 text-indigo-900'
-                    }
-                    cls = colors.get(kind, colors['info'])
-                    parts.append(
-                        f'<div class="not-prose my-4 p-4 border rounded {cls}">'
-                        f'<div class="font-semibold mb-1">{title_co}</div>'
-                        f'<div class="text-sm opacity-90">{text_co}</div>'
-                        f'</div>'
-                    )
-                elif t == 'example':
-                    lang = str(b.get('language') or '').lower()
-                    code = str(b.get('code') or '')
-                    runnable = bool(b.get('runnable')) and lang in ('js', 'javascript', 'html')
-                    cls = f" class=\"language-{lang}\"" if lang else ''
-                    code_esc = (code
-                        .replace('&', '&amp;')
-                        .replace('<', '&lt;')
-                        .replace('>', '&gt;'))
-                    btn = ''
-                    if runnable:
-                        btn = '<button type="button" class="vs-run-js inline-flex items-center px-3 py-1.5 rounded bg-slate-800 text-white text-sm hover:bg-slate-700">Run</button>'
-                    parts.append(
-                        '<div class="not-prose my-4 border rounded overflow-hidden">'
-                        '<div class="px-3 py-2 border-b bg-slate-50 flex items-center justify-between">'
-                        '<div class="text-xs uppercase tracking-wide text-slate-500">Example</div>'
-                        f'{btn}'
-                        '</div>'
-                        f'<pre class="m-0"><code{cls}>' + code_esc + '</code></pre>'
-                        '<div class="vs-output hidden">'
-                        '<iframe class="w-full h-64" sandbox="allow-scripts allow-same-origin"></iframe>'
-                        '</div>'
-                        '</div>'
-                    )
-                elif t == 'quiz':
-                    question = hesc(b.get('question') or '')
-                    choices = b.get('choices') or []
-                    correct = b.get('correctIndex')
-                    explanation = hesc(b.get('explanation') or '')
-                    if not isinstance(choices, list) or correct is None:
-                        continue
-                    quiz_counter += 1
-                    qid = f"quiz-{quiz_counter}"
-                    # Build choices
-                    opts = []
-                    for idx, ch in enumerate(choices):
-                        label = hesc(ch)
-                        rid = f"{qid}-opt-{idx}"
-                        opts.append(
-                            '<div class="flex items-start gap-2">'
-                            f'<input id="{rid}" type="radio" name="{qid}" value="{idx}" class="mt-1">'
-                            f'<label for="{rid}">{label}</label>'
-                            '</div>'
-                        )
-                    explain_html = f'<div class="vs-quiz-explain mt-2 text-sm text-slate-600 hidden">{explanation}</div>' if explanation else ''
-                    parts.append(''.join([
-                        f'<div class="not-prose my-4 p-4 border rounded vs-quiz" data-answer="{int(correct)}">',
-                        f'<div class="font-medium mb-2">{question}</div>',
-                        ''.join(opts),
-                        '<div class="mt-3 flex items-center gap-3">',
-                        '<button type="button" class="vs-quiz-check px-3 py-1.5 rounded bg-indigo-600 text-white text-sm">Check</button>',
-                        '<span class="vs-quiz-result text-sm"></span>',
-                        '</div>',
-                        explain_html,
-                        '</div>'
-                    ]))
-                else:
-                    # unknown type -> ignore
-                    continue
-            # Build TOC HTML
-            if toc:
-                toc_items = []
-                for item in toc:
-                    indent = (item['level'] - 2) * 12
-                    indent = max(0, indent)
-                    toc_items.append(
-                        f'<a href="#' + item['id'] + f'" class="block pl-{indent} py-1 hover:text-indigo-600">' + item['text'] + '</a>'
-                    )
-                toc_html = '\n'.join(toc_items)
-            else:
-                toc_html = ''
-            return '\n'.join(parts), toc_html
-
-        html, toc_html = render_blocks(blocks)
-
-        # Sanitize again as defense-in-depth
-        allowed_tags = set(bleach.sanitizer.ALLOWED_TAGS).union({
-            'p', 'pre', 'code', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-            'table', 'thead', 'tbody', 'tr', 'th', 'td', 'blockquote', 'ul', 'ol', 'li',
-            'iframe', 'img', 'div', 'button', 'input', 'label', 'form', 'span'
-        })
-        allowed_attrs = {
-            **bleach.sanitizer.ALLOWED_ATTRIBUTES,
-            'a': ['href', 'title', 'rel', 'target', 'class'],
-            'code': ['class'],
-            'p': ['class'],
-            'pre': ['class'],
-            'h1': ['id', 'class'], 'h2': ['id', 'class'], 'h3': ['id', 'class'], 'h4': ['id', 'class'], 'h5': ['id', 'class'], 'h6': ['id', 'class'],
-            'ul': ['class'], 'ol': ['class'], 'li': ['class'],
-            'table': ['class'], 'thead': ['class'], 'tbody': ['class'], 'tr': ['class'], 'th': ['align', 'class'], 'td': ['align', 'class'],
-            'th': ['align'],
-            'td': ['align'],
-            'iframe': ['src', 'width', 'height', 'allow', 'allowfullscreen', 'frameborder', 'loading', 'referrerpolicy', 'title', 'class', 'style'],
-            'img': ['src', 'alt', 'title', 'width', 'height', 'loading', 'class'],
-            'div': ['class', 'data-answer', 'style'],
-            'button': ['class', 'type'],
-            'input': ['class', 'type', 'name', 'value', 'id', 'checked'],
-            'label': ['for', 'class'],
-            'form': ['class'],
-            'span': ['class']
-        }
-        css = CSSSanitizer(
-            allowed_css_properties=[
-                'position', 'padding', 'padding-bottom', 'height', 'overflow',
-                'top', 'left', 'width', 'border', 'max-width', 'min-height'
-            ]
-        )
-        html = bleach.clean(
-            html,
-            tags=list(allowed_tags),
-            attributes=allowed_attrs,
-            protocols=['http', 'https', 'mailto'],
-            strip=True,
-            css_sanitizer=css,
-        )
-        # refresh index lazily when content is requested (simple approach)
-        app.config['_LESSON_INDEX'] = None
+
+        if cached is not None:
+            return render_template('lesson.html', title=title, slug=slug, content_html=html, toc_html=toc_html, summary=summary, tags=tags)
+
+        # Rendered HTML is cached below, so the parsed blocks are no longer needed;
+        # released only here so a denied Pro visit doesn't discard them
+        app.config['_LESSON_BLOCKS'].pop(slug, None)
+        html, toc_html = _render_blocks(blocks)
+
+        # render_blocks escapes every text field and only emits allow-listed
+        # URLs, so bleach only runs as a canary when DEBUG_SANITIZE is set
+        if debug_sanitize:
+            with _CLEANER_LOCK:
+                html = _get_cleaner().clean(html)
+        with _lesson_html_lock:
+            _lesson_html_cache[cache_key] = (title, summary, tags, html, toc_html)
+            if len(_lesson_html_cache) > _LESSON_HTML_CACHE_SIZE:
+                _lesson_html_cache.popitem(last=False)
         return render_template('lesson.html', title=title, slug=slug, content_html=html, toc_html=toc_html, summary=summary, tags=tags)
 
     # -------------------- Progress tracking --------------------
@@ -661,46 +1032,101 @@ def create_app() -> Flask:
         os.makedirs(d, exist_ok=True)
         return d
 
-    def _progress_file(uid: str) -> str:
-        return os.path.join(_data_dir(), f"progress_{uid}.json")
+    # Progress lives in one SQLite table keyed by (uid, slug); WAL lets
+    # gunicorn workers read while another writes. Connections are per thread;
+    # the schema and migration run once per process, on first use.
+    _progress_local = threading.local()
+    _progress_init_lock = threading.Lock()
+    _progress_ready = False
+
+    def _progress_db():
+        nonlocal _progress_ready
+        conn = getattr(_progress_local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(_data_dir(), 'progress.sqlite3'), timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            _progress_local.conn = conn
+        if not _progress_ready:
+            with _progress_init_lock:
+                if not _progress_ready:
+                    _init_progress_db(conn)
+                    _progress_ready = True
+        return conn
 
-    def _load_progress(uid: str) -> dict:
-        import json
-        path = _progress_file(uid)
-        if os.path.isfile(path):
+    def _init_progress_db(conn) -> None:
+        """Create the completion table and fold in per-user progress files"""
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS completion ('
+            'uid TEXT NOT NULL, slug TEXT NOT NULL, PRIMARY KEY (uid, slug)) WITHOUT ROWID'
+        )
+        d = _data_dir()
+        for name in os.listdir(d):
+            if not name.startswith('progress_'):
+                continue
+            uid, ext = os.path.splitext(name[len('progress_'):])
+            path = os.path.join(d, name)
             try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception:
-                return {"completed": []}
-        return {"completed": []}
-
-    def _save_progress(uid: str, data: dict) -> None:
-        import json
-        path = _progress_file(uid)
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-    def _all_lesson_slugs() -> list:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                if ext == '.txt':
+                    slugs = [line for line in raw.decode('utf-8').splitlines() if line]
+                elif ext == '.json':
+                    slugs = _loads(raw).get('completed', [])
+                else:
+                    continue
+                conn.execute('BEGIN')
+                conn.executemany('INSERT OR IGNORE INTO completion (uid, slug) VALUES (?, ?)',
+                                 [(uid, slug) for slug in slugs])
+                conn.execute('COMMIT')
+                os.replace(path, path + '.migrated')
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                print(f"Progress migration skipped {name}: {e}")
+
+    def _load_progress(uid: str) -> tuple:
+        rows = _progress_db().execute('SELECT slug FROM completion WHERE uid = ? ORDER BY slug', (uid,))
+        return tuple(slug for (slug,) in rows)
+
+    def _set_progress(uid: str, slug: str, done: bool) -> None:
+        if done:
+            _progress_db().execute('INSERT OR IGNORE INTO completion (uid, slug) VALUES (?, ?)', (uid, slug))
+        else:
+            _progress_db().execute('DELETE FROM completion WHERE uid = ? AND slug = ?', (uid, slug))
+
+    # Progress totals and slug validation only need the slug set; it is
+    # rebuilt when any content directory's mtime changes (adding, removing or
+    # renaming a file in a directory bumps that directory's mtime, nested or not)
+    _slug_cache = {'root': None, 'dirs': (), 'mtimes': None, 'slugs': frozenset()}
+    _slug_lock = threading.Lock()
+
+    def _dir_mtimes(dirs) -> Optional[tuple]:
+        try:
+            return tuple(os.stat(d).st_mtime_ns for d in dirs)
+        except OSError:
+            return None
+
+    def _all_lesson_slugs() -> frozenset:
         content_dir = _content_dir()
-        slugs = set()
-        for root, _, files in os.walk(content_dir):
-            for f in files:
-                lower = f.lower()
-                if lower.endswith('.json'):
-                    abs_path = os.path.join(root, f)
-                    rel_path = os.path.relpath(abs_path, content_dir)
-                    slug = rel_path.replace(os.sep, '/').rsplit('.', 1)[0].replace('\\', '/')
-                    slugs.add(slug)
-        return sorted(slugs)
+        with _slug_lock:
+            if _slug_cache['root'] == content_dir and _slug_cache['mtimes'] is not None \
+                    and _dir_mtimes(_slug_cache['dirs']) == _slug_cache['mtimes']:
+                return _slug_cache['slugs']
+            dirs = []
+            slugs = frozenset(slug_from_path(entry.path, content_dir) for entry in iter_lesson_json(content_dir, dirs))
+            _slug_cache.update(root=content_dir, dirs=tuple(dirs), mtimes=_dir_mtimes(dirs), slugs=slugs)
+            return _slug_cache['slugs']
+
+    def _lesson_total() -> int:
+        return len(_all_lesson_slugs())
 
     @app.get('/api/progress')
     @login_required
     def get_progress():
         uid = g.user.get('uid')
-        prog = _load_progress(uid)
-        total = len(_all_lesson_slugs())
-        completed = list(set(prog.get('completed', [])))
+        completed = _load_progress(uid)
+        total = _lesson_total()
         percent = int(round((len(completed) / total) * 100)) if total else 0
         return {"completed": completed, "total": total, "percent": percent}
 
@@ -712,23 +1138,28 @@ def create_app() -> Flask:
         done = bool(data.get('completed', True))
         if not slug:
             return {"error": "Missing slug"}, 400
+        # Unknown slugs can still be cleared (e.g. a lesson since removed)
+        if done and slug not in _all_lesson_slugs():
+            return {"error": "unknown slug"}, 400
         uid = g.user.get('uid')
-        prog = _load_progress(uid)
-        comp = set(prog.get('completed', []))
-        if done:
-            comp.add(slug)
-        else:
-            comp.discard(slug)
-        prog['completed'] = sorted(comp)
-        _save_progress(uid, prog)
-        total = len(_all_lesson_slugs())
-        percent = int(round((len(comp) / total) * 100)) if total else 0
-        return {"completed": list(comp), "total": total, "percent": percent}
+        _set_progress(uid, slug, done)
+        completed = _load_progress(uid)
+        total = _lesson_total()
+        percent = int(round((len(completed) / total) * 100)) if total else 0
+        return {"completed": completed, "total": total, "percent": percent}
 
     # -------------------- Pro Routes --------------------
+    # Comma-separated Firebase uids allowed to use the admin endpoints
+    admin_uids = frozenset(u.strip() for u in os.getenv('ADMIN_UIDS', '').split(',') if u.strip())
+
     @app.get('/admin/register-pro/<uid>')
+    @login_required
     def admin_register_pro(uid: str):
         """Admin endpoint to manually register a Pro user"""
+        if g.user.get('uid') not in admin_uids:
+            return {"error": "Forbidden"}, 403
+        if is_registered_pro_user(uid):
+            return {"status": "success", "uid": uid, "message": "User is already Pro"}
         register_pro_user(uid, f"admin_registered_{uid}")
         return {"status": "success", "uid": uid, "message": "User registered as Pro"}
 
@@ -739,36 +1170,40 @@ def create_app() -> Flask:
         if not has_pro_access(g.user):
             return redirect(url_for('pricing'))
         
-        # Get Pro lessons (lessons with 'pro' tag)
-        all_lessons = get_lesson_index()
-        pro_lessons = [lesson for lesson in all_lessons if 'pro' in lesson.get('tags', [])]
-        
-        return render_template('pro/dashboard.html', lessons=pro_lessons)
+        # Pro lessons (lessons with 'pro' tag) are filtered when the index is built
+        get_lesson_index()
+        return render_template('pro/dashboard.html', lessons=app.config['_PRO_LESSONS'])
 
     @app.get('/pricing')
     def pricing():
         return render_template('pricing.html', stripe_publishable_key=stripe_publishable_key)
 
+    # (success_url, cancel_url) per host the app is reached on
+    _checkout_url_cache = {}
+
+    def _checkout_urls() -> tuple:
+        urls = _checkout_url_cache.get(request.host_url)
+        if urls is None:
+            urls = (
+                url_for('payment_success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
+                url_for('pricing', _external=True),
+            )
+            if len(_checkout_url_cache) >= 16:
+                _checkout_url_cache.clear()  # Host is client-supplied; keep this small
+            _checkout_url_cache[request.host_url] = urls
+        return urls
+
     @app.post('/create-checkout-session')
     @login_required
     def create_checkout_session():
         try:
+            success_url, cancel_url = _checkout_urls()
             checkout_session = stripe.checkout.Session.create(
                 payment_method_types=['card'],
                 mode='payment',
-                line_items=[{
-                    'price_data': {
-                        'currency': 'gbp',
-                        'product_data': {
-                            'name': 'INFRA+- Pro Access',
-                            'description': 'Lifetime access to all Pro content',
-                        },
-                        'unit_amount': 999,  # £9.99
-                    },
-                    'quantity': 1,
-                }],
-                success_url=url_for('payment_success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
-                cancel_url=url_for('pricing', _external=True),
+                line_items=list(_PRO_LINE_ITEMS),
+                success_url=success_url,
+                cancel_url=cancel_url,
                 customer_email=g.user.get('email'),
                 metadata={
                     'user_id': g.user.get('uid'),
@@ -779,38 +1214,52 @@ def create_app() -> Flask:
         except Exception as e:
             return {'error': str(e)}, 400
 
+    def _set_pro_claim(uid: str):
+        """Set the Firebase 'pro' claim, keeping other claims; no write if already set"""
+        _ensure_firebase()
+        claims = admin_auth.get_user(uid).custom_claims or {}
+        if claims.get('pro') is not True:
+            admin_auth.set_custom_user_claims(uid, {**claims, 'pro': True})
+
+    def _grant_pro(uid: str, email: str):
+        """The single writer of Pro status after a payment"""
+        register_pro_user(uid, email)
+        _set_pro_claim(uid)
+
     @app.get('/payment/success')
     @login_required
     def payment_success():
         session_id = request.args.get('session_id')
         if not session_id:
             return redirect(url_for('pricing'))
-        
+
+        # The webhook normally grants Pro before Stripe redirects here
+        if has_pro_access(g.user):
+            return render_template('payment_success.html')
+
         try:
-            # Verify the session
+            # Webhook not seen yet: verify the session ourselves
             session = stripe.checkout.Session.retrieve(session_id)
-            if session.payment_status == 'paid':
-                # Register user as Pro
-                uid = g.user.get('uid')
-                email = g.user.get('email')
-                register_pro_user(uid, email)
-                
-                # Also set Firebase claims as backup
-                try:
-                    admin_auth.set_custom_user_claims(uid, {'pro': True})
-                except:
-                    pass  # Ignore Firebase errors
-                
-                return render_template('payment_success.html', session=session)
-            else:
-                return redirect(url_for('pricing'))
         except Exception as e:
             print(f"Payment success error: {e}")
             return redirect(url_for('pricing'))
+        uid = g.user.get('uid')
+        metadata = session.metadata or {}
+        if session.payment_status != 'paid' or metadata.get('user_id') != uid:
+            return redirect(url_for('pricing'))
+        try:
+            _grant_pro(uid, g.user.get('email'))
+        except Exception as e:
+            print(f"Payment success error: {e}")
+        return render_template('payment_success.html', session=session)
+
+    _webhook_seen = OrderedDict()
+    _webhook_lock = threading.Lock()
 
     @app.post('/stripe/webhook')
     def stripe_webhook():
-        payload = request.data
+        # Raw body, not kept on the request object; only needed for verification
+        payload = request.get_data(cache=False)
         sig_header = request.headers.get('stripe-signature')
 
         try:
@@ -819,6 +1268,15 @@ def create_app() -> Flask:
             return 'Invalid payload', 400
         except stripe.error.SignatureVerificationError:
             return 'Invalid signature', 400
+        finally:
+            del payload
+
+        # Stripe redelivers events; skip ones this worker already handled
+        event_id = event['id']
+        with _webhook_lock:
+            if event_id in _webhook_seen:
+                _webhook_seen.move_to_end(event_id)
+                return 'Success', 200
 
         # Handle the event
         if event['type'] == 'checkout.session.completed':
@@ -826,8 +1284,12 @@ def create_app() -> Flask:
             user_id = session.metadata.get('user_id')
             if user_id:
                 # Grant Pro access
-                admin_auth.set_custom_user_claims(user_id, {'pro': True})
+                _grant_pro(user_id, session.metadata.get('user_email'))
 
+        with _webhook_lock:
+            _webhook_seen[event_id] = event['created']
+            if len(_webhook_seen) > _WEBHOOK_SEEN_MAX:
+                _webhook_seen.popitem(last=False)
         return 'Success', 200
 
     # Health check
@@ -844,15 +1306,22 @@ def create_app() -> Flask:
     def server_error(e):
         return render_template('500.html'), 500
 
-    # Security headers
+    # Security headers, fixed at startup
+    _security_headers = (
+        ('X-Content-Type-Options', 'nosniff'),
+        ('X-Frame-Options', 'DENY'),
+        ('Referrer-Policy', 'strict-origin-when-cross-origin'),
+    )
+    # Only set HSTS if cookies are secure (assume HTTPS in that case)
+    if app.config.get("SESSION_COOKIE_SECURE"):
+        _security_headers += (('Strict-Transport-Security', 'max-age=63072000; includeSubDomains; preload'),)
+
     @app.after_request
     def set_security_headers(resp):
-        resp.headers.setdefault('X-Content-Type-Options', 'nosniff')
-        resp.headers.setdefault('X-Frame-Options', 'DENY')
-        resp.headers.setdefault('Referrer-Policy', 'strict-origin-when-cross-origin')
-        # Only set HSTS if cookies are secure (assume HTTPS in that case)
-        if app.config.get("SESSION_COOKIE_SECURE"):
-            resp.headers.setdefault('Strict-Transport-Security', 'max-age=63072000; includeSubDomains; preload')
+        headers = resp.headers
+        for k, v in _security_headers:
+            if k not in headers:
+                headers[k] = v
         # A relaxed CSP suitable for this app (adjust as needed)
         # CSP removed for development - re-add before production with proper configuration
         # resp.headers.setdefault(
@@ -867,22 +1336,29 @@ def create_app() -> Flask:
         # )
         return resp
 
+    # Firebase Web SDK config for the client; the env is fixed for the
+    # process lifetime, so the script is built once
+    _firebase_web_cfg = {
+        'apiKey': os.getenv('FIREBASE_WEB_API_KEY', ''),
+        'authDomain': os.getenv('FIREBASE_WEB_AUTH_DOMAIN', ''),
+        'projectId': os.getenv('FIREBASE_PROJECT_ID', ''),
+        'appId': os.getenv('FIREBASE_WEB_APP_ID', ''),
+        'messagingSenderId': os.getenv('FIREBASE_WEB_MESSAGING_SENDER_ID', ''),
+    }
+    _config_js_body = (
+        'window.FIREBASE_CONFIG = ' + json.dumps(_firebase_web_cfg, separators=(',', ':')) + ';\n'
+    ).encode('utf-8')
+    _config_js_etag = hashlib.md5(_config_js_body).hexdigest()
+    _config_js_headers = {
+        'ETag': f'"{_config_js_etag}"',
+        'Cache-Control': 'public, max-age=3600, immutable',
+    }
+
     @app.get('/config.js')
     def config_js():
-        # Provide Firebase Web SDK config to client
-        cfg = {
-            'apiKey': os.getenv('FIREBASE_WEB_API_KEY', ''),
-            'authDomain': os.getenv('FIREBASE_WEB_AUTH_DOMAIN', ''),
-            'projectId': os.getenv('FIREBASE_PROJECT_ID', ''),
-            'appId': os.getenv('FIREBASE_WEB_APP_ID', ''),
-            'messagingSenderId': os.getenv('FIREBASE_WEB_MESSAGING_SENDER_ID', ''),
-        }
-        js = (
-            'window.FIREBASE_CONFIG = ' + __import__('json').dumps(cfg) + ';\n'
-        )
-        resp = make_response(js)
-        resp.headers['Content-Type'] = 'application/javascript'
-        return resp
+        if request.if_none_match.contains_weak(_config_js_etag):
+            return Response(status=304, headers=_config_js_headers)
+        return Response(_config_js_body, mimetype='application/javascript', headers=_config_js_headers)
 
     @app.get('/support')
     def support():
@@ -0,0 +1,206 @@
+"""
+Lesson index: metadata extraction and the content walk, shared by the app and
+tools/build_lesson_index.py (no Flask or Firebase imports here)
+"""
+import os
+import hashlib
+import json
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
+# Prebuilt index at the top of the content directory; not a lesson
+PREBUILT_INDEX = '_index.json'
+PREBUILT_SLUG = '_index'
+
+# Searchable text fields per lesson block type: scalar fields, and list
+# fields whose items (or nested rows, for tables) are strings.
+_BLOCK_FIELDS = {
+    'heading': ('text',),
+    'paragraph': ('text',),
+    'code': ('code',),
+    'callout': ('title', 'text'),
+    'quiz': ('question', 'explanation'),
+    'link': ('text',),
+    'image': ('alt',),
+}
+_BLOCK_LIST_FIELDS = {
+    'list': ('items',),
+    'steps': ('items',),
+    'table': ('headers', 'rows'),
+    'quiz': ('choices',),
+}
+
+
+def _extract_text(data: dict):
+    """Yield the searchable strings of a lesson without building a list."""
+    yield str(data.get('title') or '')
+    yield str(data.get('summary') or '')
+    for b in data.get('blocks') or []:
+        if not isinstance(b, dict):
+            continue
+        t = (b.get('type') or '').lower()
+        for fld in _BLOCK_FIELDS.get(t, ()):
+            v = b.get(fld)
+            if v:
+                yield str(v)
+        for fld in _BLOCK_LIST_FIELDS.get(t, ()):
+            for v in b.get(fld) or []:
+                if isinstance(v, list):
+                    for c in v:
+                        if c:
+                            yield str(c)
+                elif v:
+                    yield str(v)
+
+
+@dataclass(slots=True, frozen=True)
+class Lesson:
+    """Lesson metadata, normalized once when the index is built."""
+    slug: str
+    title: str
+    summary: str
+    tags: tuple
+    text: str
+    # Lowercased copies so /search never lowercases per query
+    title_l: str
+    summary_l: str
+    tags_l: tuple
+    # Hashable tags for membership tests such as 'pro' in tag_set
+    tag_set: frozenset
+    path: str
+    mtime_ns: int
+
+    @classmethod
+    def from_data(cls, data: dict, slug: str, path: str, mtime_ns: int) -> 'Lesson':
+        title = str(data.get('title') or '')
+        summary = str(data.get('summary') or '')
+        tags = data.get('tags') or []
+        if not isinstance(tags, list):
+            tags = []
+        return cls(
+            slug=slug,
+            title=title,
+            summary=summary,
+            tags=tuple(tags),
+            text='\n'.join(_extract_text(data)).lower(),
+            title_l=title.lower(),
+            summary_l=summary.lower(),
+            tags_l=tuple(str(t).lower() for t in tags),
+            tag_set=frozenset(t for t in tags if isinstance(t, str)),
+            path=path,
+            mtime_ns=mtime_ns,
+        )
+
+    def to_dict(self) -> dict:
+        # JSON-safe form; tag_set is rebuilt from tags on the way back
+        d = asdict(self)
+        del d['tag_set']
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'Lesson':
+        # Inverse of to_dict() after a JSON round trip (tuples come back as lists)
+        tags = tuple(d['tags'])
+        return cls(**{**d, 'tags': tags, 'tags_l': tuple(d['tags_l']),
+                      'tag_set': frozenset(t for t in tags if isinstance(t, str))})
+
+
+def slug_from_path(abs_path: str, base_dir: str) -> str:
+    rel = os.path.relpath(abs_path, base_dir)
+    # Normalize to forward slashes
+    rel = rel.replace('\\', '/')
+    if rel.lower().endswith('.json'):
+        rel = rel[:-5]
+    return rel
+
+
+def iter_lesson_json(base: str, dirs: Optional[list] = None):
+    """scandir walk yielding the DirEntry of every lesson JSON in os.walk
+    order; file types come from the directory read, so no per-entry stat.
+    Directories visited are appended to dirs when given."""
+    stack = [base]
+    while stack:
+        d = stack.pop()
+        subdirs = []
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        if dirs is not None:
+            dirs.append(d)
+        with it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    subdirs.append(e.path)
+                elif e.name.lower().endswith('.json') and not (d == base and e.name == PREBUILT_INDEX):
+                    yield e
+        stack.extend(reversed(subdirs))
+
+
+def content_signature(base: str) -> str:
+    """Fingerprint of every lesson file (relative path, mtime, size); stat
+    only, no parsing, and independent of where the content directory lives"""
+    h = hashlib.md5()
+    for entry in iter_lesson_json(base):
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        rel = os.path.relpath(entry.path, base)
+        h.update(f"{rel}\0{st.st_mtime_ns}\0{st.st_size}\n".encode('utf-8', 'surrogateescape'))
+    return h.hexdigest()
+
+
+def scan_lessons(base: str) -> tuple:
+    """Parse every lesson under base into (index, slug -> (mtime_ns, blocks))"""
+    idx = []
+    blocks = {}
+    for entry in iter_lesson_json(base):
+        fp = entry.path
+        try:
+            with open(fp, 'rb') as f:
+                data = _loads(f.read())
+        except Exception:
+            continue
+        if not isinstance(data, dict):
+            continue
+        try:
+            mtime_ns = entry.stat().st_mtime_ns
+        except OSError:
+            continue
+        item = Lesson.from_data(data, slug_from_path(fp, base), fp, mtime_ns)
+        idx.append(item)
+        blocks[item.slug] = (mtime_ns, data.get('blocks') or [])
+    return idx, blocks
+
+
+def write_prebuilt_index(base: str, sig: str, idx: list) -> str:
+    """Write the index with the content signature it was built from"""
+    lessons = []
+    for item in idx:
+        d = item.to_dict()
+        d['path'] = os.path.relpath(item.path, base)
+        lessons.append(d)
+    path = os.path.join(base, PREBUILT_INDEX)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'sig': sig, 'lessons': lessons}, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, path)
+    return path
+
+
+def load_prebuilt_index(base: str, sig: str) -> Optional[list]:
+    """Return the prebuilt index if it was built from exactly this content"""
+    try:
+        with open(os.path.join(base, PREBUILT_INDEX), 'rb') as f:
+            raw = _loads(f.read())
+        if raw.get('sig') != sig:
+            return None
+        return [Lesson.from_dict({**d, 'path': os.path.join(base, d['path'])}) for d in raw['lessons']]
+    except Exception:
+        return None
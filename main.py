@@ -4,38 +4,30 @@ VoidSyn - Main entry point for the executable version
 """
 import sys
 import os
-import threading
 import webbrowser
-import time
+from werkzeug.serving import make_server
 from app import create_app
 
-def open_browser():
-    """Open the default web browser after a short delay"""
-    time.sleep(1.5)  # Give the server time to start
-    webbrowser.open('http://127.0.0.1:5000')
-
 def main():
     """Main function to run the Flask application"""
     try:
         # Create the Flask app
         app = create_app()
         
-        # Start browser in a separate thread
-        browser_thread = threading.Thread(target=open_browser)
-        browser_thread.daemon = True
-        browser_thread.start()
+        # make_server returns once the socket is listening, so the browser
+        # can be opened straight away without racing the server
+        server = make_server('127.0.0.1', 5000, app, threaded=True)
         
         print("Starting VoidSyn...")
         print("Server will be available at: http://127.0.0.1:5000")
         print("Press Ctrl+C to stop the server")
         
-        # Run the Flask app
-        app.run(
-            host='127.0.0.1',
-            port=5000,
-            debug=False,  # Disable debug mode for production
-            use_reloader=False  # Disable auto-reloader for executable
-        )
+        webbrowser.open('http://127.0.0.1:5000')
+        
+        # Run the Flask app (no debugger, no reloader); Werkzeug's
+        # serve_forever handles Ctrl+C itself and returns
+        server.serve_forever()
+        print("\nShutting down VoidSyn...")
         
     except KeyboardInterrupt:
         print("\nShutting down VoidSyn...")
@@ -0,0 +1,37 @@
+import atexit
+import os
+import sys
+import tempfile
+
+# app.py creates the app at import and requires a service-account path to exist
+_sa_fd, _sa_path = tempfile.mkstemp(suffix='.json')
+os.write(_sa_fd, b'{}')
+os.close(_sa_fd)
+atexit.register(os.unlink, _sa_path)
+os.environ.setdefault('GOOGLE_APPLICATION_CREDENTIALS', _sa_path)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import _render_blocks  # noqa: E402
+
+
+def _html(block):
+    return _render_blocks([block])[0]
+
+
+def test_code_block_without_language():
+    assert _html({'type': 'code', 'code': 'x = 1'}) == '<pre><code>x = 1</code></pre>'
+
+
+def test_code_block_with_language():
+    assert _html({'type': 'code', 'language': 'Python', 'code': 'a < b'}) == \
+        '<pre><code class="language-python">a &lt; b</code></pre>'
+
+
+def test_example_block_without_language():
+    html = _html({'type': 'example', 'code': 'y = 2'})
+    assert '<pre class="m-0"><code>y = 2</code></pre>' in html
+
+
+def test_example_block_with_language():
+    html = _html({'type': 'example', 'language': 'js', 'code': 'z()'})
+    assert '<pre class="m-0"><code class="language-js">z()</code></pre>' in html
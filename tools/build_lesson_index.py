@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Prebuild the lesson index into <content>/_index.json so the app can load it
+with one read instead of parsing every lesson on its first request.
+
+Usage: python tools/build_lesson_index.py [CONTENT_DIR]
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lesson_index import content_signature, scan_lessons, write_prebuilt_index
+
+
+def main():
+    base = sys.argv[1] if len(sys.argv) > 1 else os.getenv('CONTENT_DIR') or os.path.join(ROOT, 'content')
+    if not os.path.isdir(base):
+        print(f"Content directory not found: {base}")
+        sys.exit(1)
+    # Signature first: if a lesson changes mid-build the file is simply stale
+    sig = content_signature(base)
+    idx, _ = scan_lessons(base)
+    path = write_prebuilt_index(base, sig, idx)
+    print(f"Indexed {len(idx)} lessons into {path}")
+
+
+if __name__ == '__main__':
+    main()